@@ -6,17 +6,30 @@ from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
     create_async_engine,
 )
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-# Fallback für lokale Entwicklung, später per ENV überschrieben
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
 
-# Für Async Treiber umschreiben, damit postgres (psycopg2) / sqlite ohne Anpassung laufen
-if DATABASE_URL.startswith("postgresql+psycopg2"):
-    DATABASE_URL = DATABASE_URL.replace("postgresql+psycopg2", "postgresql+asyncpg", 1)
-elif DATABASE_URL.startswith("postgresql://"):
-    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
-elif DATABASE_URL.startswith("sqlite:///"):
-    DATABASE_URL = DATABASE_URL.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+def to_async_url(url: str) -> str:
+    # Für Async Treiber umschreiben, damit postgres / sqlite ohne Anpassung laufen
+    if url.startswith("postgresql+psycopg2"):
+        return url.replace("postgresql+psycopg2", "postgresql+asyncpg", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    return url
+
+
+# Fallback für lokale Entwicklung, später per ENV überschrieben
+DATABASE_URL = to_async_url(os.getenv("DATABASE_URL", "sqlite:///./app.db"))
+# Optionales Read-Replica, ohne ENV laufen auch Lesezugriffe auf dem Primary
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+if DATABASE_REPLICA_URL:
+    DATABASE_REPLICA_URL = to_async_url(DATABASE_REPLICA_URL)
+# Wie lange nach einem Schreibzugriff der Browser noch vom Primary liest
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+PRIMARY_COOKIE = "lm_primary"
 
 engine = create_async_engine(
     DATABASE_URL,
@@ -27,7 +40,63 @@ AsyncSessionLocal = async_sessionmaker(
     engine, autocommit=False, autoflush=False, expire_on_commit=False
 )
 
+if DATABASE_REPLICA_URL:
+    replica_engine = create_async_engine(
+        DATABASE_REPLICA_URL,
+        echo=False,
+    )
+    ReplicaSessionLocal = async_sessionmaker(
+        replica_engine, autocommit=False, autoflush=False, expire_on_commit=False
+    )
+else:
+    replica_engine = engine
+    ReplicaSessionLocal = AsyncSessionLocal
+
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    # Read-your-writes: wer gerade geschrieben hat, liest kurz vom Primary,
+    # damit der eigene Upload / die eigene Reaktion sofort sichtbar ist
+    if request.cookies.get(PRIMARY_COOKIE):
+        session_factory = AsyncSessionLocal
+    else:
+        session_factory = ReplicaSessionLocal
+    async with session_factory() as session:
+        yield session
+
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class ReadYourWritesMiddleware:
+    # Setzt nach jedem erfolgreichen Schreibzugriff (POST, PATCH, DELETE, ...)
+    # ein kurzlebiges Cookie, das get_read_db auf den Primary umlenkt
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] in READ_METHODS
+            or replica_engine is engine
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def sticky_send(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = (
+                    f"{PRIMARY_COOKIE}=1; Max-Age={REPLICA_STICKY_SECONDS}; "
+                    "Path=/; HttpOnly; SameSite=lax"
+                )
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"set-cookie", cookie.encode("latin-1")),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, sticky_send)
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import base64
+import io
+import os
+from pathlib import Path
+from typing import Any
+
+from PIL import ExifTags, Image, ImageOps
+
+from app import logic
+from app.db import AsyncSessionLocal, engine
+from app.models import Meme, MemeTemplate, upgrade_schema
+
+STATIC_DIR = Path(__file__).resolve().parent / "static"
+# Kantenlaenge des Platzhalters, als WEBP landet er bei wenigen hundert Bytes
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_MAX_LENGTH = 2048
+BACKFILL_BATCH_SIZE = 100
+
+
+def read_image_metadata(path: Path) -> dict[str, Any]:
+    # Blockiert (Dekodieren), daher aus async Code per run_in_threadpool aufrufen
+    metadata: dict[str, Any] = {
+        "width": None,
+        "height": None,
+        "byte_size": os.path.getsize(path),
+        "image_format": None,
+        "placeholder": None,
+    }
+    try:
+        with Image.open(path) as image:
+            metadata["image_format"] = (image.format or "").lower() or None
+            width, height = image.size
+            if image.getexif().get(ExifTags.Base.Orientation, 1) in {5, 6, 7, 8}:
+                width, height = height, width
+            metadata["width"], metadata["height"] = width, height
+            # JPEGs gleich verkleinert dekodieren statt in voller Aufloesung
+            image.draft("RGB", (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+            image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+            thumb = ImageOps.exif_transpose(image).convert("RGBA")
+        # Pillow ohne WEBP-Support wirft hier, dann eben ohne Platzhalter
+        buffer = io.BytesIO()
+        thumb.save(buffer, format="WEBP", quality=40)
+    except (OSError, ValueError, KeyError, Image.DecompressionBombError):
+        return metadata
+    placeholder = "data:image/webp;base64," + base64.b64encode(
+        buffer.getvalue()
+    ).decode("ascii")
+    if len(placeholder) <= PLACEHOLDER_MAX_LENGTH:
+        metadata["placeholder"] = placeholder
+    return metadata
+
+
+async def backfill(model: Any) -> tuple[int, int]:
+    updated = 0
+    skipped = 0
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            batch = await logic.list_missing_image_metadata(
+                session, model, last_id, BACKFILL_BATCH_SIZE
+            )
+            if not batch:
+                return updated, skipped
+            for item in batch:
+                last_id = item.id
+                path = STATIC_DIR / item.file_path
+                if not path.is_file():
+                    skipped += 1
+                    continue
+                metadata = await asyncio.to_thread(read_image_metadata, path)
+                logic.apply_image_metadata(item, metadata)
+                updated += 1
+            await session.commit()
+
+
+async def run() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(upgrade_schema)
+    for model, label in ((MemeTemplate, "Templates"), (Meme, "Memes")):
+        updated, skipped = await backfill(model)
+        print(f"{label}: {updated} aktualisiert, {skipped} ohne Datei uebersprungen.")
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Bildmetadaten und Platzhalter fuer bestehende Uploads nachtragen."
+    )
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import os
+import re
+import time
+from collections import Counter
+from collections.abc import Callable
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Grenzen per ENV anpassbar, Defaults reichen fuer ein paar Dutzend Gaeste
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_CONCURRENCY_PER_USER = int(os.getenv("UPLOAD_CONCURRENCY_PER_USER", "2"))
+REACT_RATE_PER_SECOND = float(os.getenv("REACT_RATE_PER_SECOND", "2"))
+REACT_BURST = int(os.getenv("REACT_BURST", "10"))
+
+UPLOAD_PATHS = {"/memes/upload", "/templates/upload"}
+UPLOAD_CHUNK_PATH = re.compile(r"^/uploads/[0-9a-f]{32}$")
+REACT_PATH = re.compile(r"^/memes/\d+/react$")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated_at) * self.rate >= self.burst
+
+    def try_take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def retry_after(self) -> int:
+        if self.rate <= 0:
+            return 60
+        return max(1, int((1 - self.tokens) / self.rate) + 1)
+
+
+class AdmissionControl:
+    # Alles laeuft in einem Event Loop, daher reichen einfache Zaehler ohne Locks
+    def __init__(
+        self,
+        upload_concurrency: int = UPLOAD_CONCURRENCY,
+        upload_concurrency_per_user: int = UPLOAD_CONCURRENCY_PER_USER,
+        react_rate: float = REACT_RATE_PER_SECOND,
+        react_burst: int = REACT_BURST,
+        max_upload_bytes: int = MAX_UPLOAD_BYTES,
+    ) -> None:
+        self.upload_concurrency = upload_concurrency
+        self.upload_concurrency_per_user = upload_concurrency_per_user
+        self.react_rate = react_rate
+        self.react_burst = react_burst
+        self.max_upload_bytes = max_upload_bytes
+        self.active_uploads = 0
+        self.active_uploads_by_user: Counter[str] = Counter()
+        self.react_buckets: dict[str, TokenBucket] = {}
+        self.react_swept_at = time.monotonic()
+        self.shed: Counter[str] = Counter()
+
+    def try_acquire_upload(self, user_key: str) -> Optional[str]:
+        if self.active_uploads >= self.upload_concurrency:
+            return "upload_global"
+        if self.active_uploads_by_user[user_key] >= self.upload_concurrency_per_user:
+            return "upload_user"
+        self.active_uploads += 1
+        self.active_uploads_by_user[user_key] += 1
+        return None
+
+    def release_upload(self, user_key: str) -> None:
+        self.active_uploads -= 1
+        self.active_uploads_by_user[user_key] -= 1
+        if self.active_uploads_by_user[user_key] <= 0:
+            del self.active_uploads_by_user[user_key]
+
+    def react_bucket(self, user_key: str) -> TokenBucket:
+        self.sweep_react_buckets()
+        bucket = self.react_buckets.get(user_key)
+        if bucket is None:
+            bucket = TokenBucket(self.react_rate, self.react_burst)
+            self.react_buckets[user_key] = bucket
+        return bucket
+
+    def sweep_react_buckets(self) -> None:
+        # Volle Buckets sind gleichwertig zu neuen und koennen weg, sonst waechst
+        # das Dict mit jeder IP. Hoechstens einmal pro Refill-Dauer durchgehen.
+        now = time.monotonic()
+        refill_seconds = self.react_burst / self.react_rate if self.react_rate > 0 else 60
+        if now - self.react_swept_at < refill_seconds:
+            return
+        self.react_swept_at = now
+        for key in [key for key, bucket in self.react_buckets.items() if bucket.is_full(now)]:
+            del self.react_buckets[key]
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "active_uploads": self.active_uploads,
+            "upload_global": self.shed["upload_global"],
+            "upload_user": self.shed["upload_user"],
+            "react_rate": self.shed["react_rate"],
+            "body_too_large": self.shed["body_too_large"],
+        }
+
+
+admission = AdmissionControl()
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class AdmissionControlMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        controller: AdmissionControl,
+        user_resolver: Callable[[Request], Optional[str]],
+    ) -> None:
+        self.app = app
+        self.controller = controller
+        self.user_resolver = user_resolver
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        path = scope["path"]
+        # Resumable Chunks (PATCH) zaehlen wie normale Uploads mit
+        if (method == "POST" and path in UPLOAD_PATHS) or (
+            method == "PATCH" and UPLOAD_CHUNK_PATH.match(path)
+        ):
+            await self.handle_upload(scope, receive, send)
+            return
+        if method == "POST" and REACT_PATH.match(path):
+            await self.handle_react(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+    def user_key(self, scope: Scope) -> str:
+        request = Request(scope)
+        user = self.user_resolver(request)
+        if user:
+            return f"user:{user}"
+        return f"ip:{request.client.host if request.client else 'unknown'}"
+
+    async def reject(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        reason: str,
+        status_code: int,
+        message: str,
+        retry_after: Optional[int] = None,
+    ) -> None:
+        self.controller.shed[reason] += 1
+        headers = {"Retry-After": str(retry_after)} if retry_after else None
+        response = PlainTextResponse(message, status_code=status_code, headers=headers)
+        await response(scope, receive, send)
+
+    async def handle_react(self, scope: Scope, receive: Receive, send: Send) -> None:
+        bucket = self.controller.react_bucket(self.user_key(scope))
+        if not bucket.try_take():
+            await self.reject(
+                scope,
+                receive,
+                send,
+                "react_rate",
+                429,
+                "Zu viele Reaktionen, bitte kurz warten.",
+                retry_after=bucket.retry_after(),
+            )
+            return
+        await self.app(scope, receive, send)
+
+    async def handle_upload(self, scope: Scope, receive: Receive, send: Send) -> None:
+        max_bytes = self.controller.max_upload_bytes
+        content_length = Request(scope).headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > max_bytes:
+            await self.reject(
+                scope, receive, send, "body_too_large", 413, "Die Datei ist zu gross."
+            )
+            return
+        user_key = self.user_key(scope)
+        reason = self.controller.try_acquire_upload(user_key)
+        if reason == "upload_global":
+            await self.reject(
+                scope,
+                receive,
+                send,
+                reason,
+                503,
+                "Gerade laufen zu viele Uploads, bitte gleich nochmal versuchen.",
+                retry_after=5,
+            )
+            return
+        if reason == "upload_user":
+            await self.reject(
+                scope,
+                receive,
+                send,
+                reason,
+                429,
+                "Warte bis dein laufender Upload fertig ist.",
+                retry_after=5,
+            )
+            return
+
+        # Ohne (ehrliches) Content-Length trotzdem mitzaehlen, bevor UploadFile
+        # spoolt. FastAPI macht aus Fehlern beim Body-Parsen ein 400, deshalb
+        # wird dessen Antwort verworfen und stattdessen 413 gesendet.
+        received = 0
+        exceeded = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    exceeded = True
+                    raise BodyTooLarge()
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        finally:
+            self.controller.release_upload(user_key)
+        if exceeded:
+            await self.reject(
+                scope, receive, send, "body_too_large", 413, "Die Datei ist zu gross."
+            )
@@ -1,9 +1,24 @@
-from typing import Optional
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Optional
 
-from sqlalchemy import delete, func, select
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import Meme, MemeReaction, MemeTemplate
+from app.models import (
+    ArchiveStats,
+    DailyUploadStats,
+    Meme,
+    MemeReaction,
+    MemeTemplate,
+    UploaderStats,
+)
+
+STATS_ROW_ID = 1
+LEADERBOARD_LIMIT = 10
+DAILY_UPLOADS_DAYS = 14
 
 
 async def list_templates(db: AsyncSession) -> list[MemeTemplate]:
@@ -38,16 +53,22 @@ async def create_template(
     file_path: str,
     original_name: Optional[str],
     uploaded_by: str,
+    metadata: Optional[dict[str, Any]] = None,
 ) -> MemeTemplate:
     template = MemeTemplate(
         title=title,
         file_path=file_path,
         original_name=original_name,
         uploaded_by=uploaded_by,
+        **(metadata or {}),
     )
     db.add(template)
-    await db.commit()
+    await db.flush()
     await db.refresh(template)
+    await _bump_upload_stats(
+        db, "templates", template.uploaded_by, template.created_at, 1
+    )
+    await db.commit()
     return template
 
 
@@ -57,25 +78,50 @@ async def create_meme(
     file_path: str,
     original_name: Optional[str],
     uploaded_by: str,
+    metadata: Optional[dict[str, Any]] = None,
 ) -> Meme:
     meme = Meme(
         title=title,
         file_path=file_path,
         original_name=original_name,
         uploaded_by=uploaded_by,
+        **(metadata or {}),
     )
     db.add(meme)
-    await db.commit()
+    await db.flush()
     await db.refresh(meme)
+    await _bump_upload_stats(db, "memes", meme.uploaded_by, meme.created_at, 1)
+    await db.commit()
     return meme
 
 
-async def get_meme_stats(db: AsyncSession) -> dict[str, int]:
-    template_count = (
-        await db.scalar(select(func.count()).select_from(MemeTemplate)) or 0
+async def list_missing_image_metadata(
+    db: AsyncSession, model: Any, after_id: int, limit: int
+) -> list[Any]:
+    result = await db.execute(
+        select(model)
+        .where(model.width.is_(None), model.id > after_id)
+        .order_by(model.id)
+        .limit(limit)
     )
-    meme_count = await db.scalar(select(func.count()).select_from(Meme)) or 0
-    return {"templates": int(template_count), "memes": int(meme_count)}
+    return list(result.scalars().all())
+
+
+def apply_image_metadata(item: Any, metadata: dict[str, Any]) -> None:
+    for name, value in metadata.items():
+        setattr(item, name, value)
+
+
+async def get_meme_stats(db: AsyncSession) -> dict[str, int]:
+    totals = await db.get(ArchiveStats, STATS_ROW_ID)
+    if totals is None:
+        return {"templates": 0, "memes": 0, "likes": 0, "dislikes": 0}
+    return {
+        "templates": totals.templates,
+        "memes": totals.memes,
+        "likes": totals.likes,
+        "dislikes": totals.dislikes,
+    }
 
 
 async def get_reaction_counts(
@@ -111,9 +157,36 @@ async def get_user_reactions(
     return {meme_id: reaction for meme_id, reaction in result.all()}
 
 
+async def get_reaction_summary(
+    db: AsyncSession, meme_id: int, user_name: str
+) -> tuple[dict[str, int], Optional[str]]:
+    # Zaehler und eigene Reaktion in einer Query statt zwei
+    result = await db.execute(
+        select(
+            MemeReaction.reaction,
+            func.count(),
+            func.max(case((MemeReaction.user_name == user_name, 1), else_=0)),
+        )
+        .where(MemeReaction.meme_id == meme_id)
+        .group_by(MemeReaction.reaction)
+    )
+    counts = {"like": 0, "dislike": 0}
+    user_reaction = None
+    for reaction, count, is_own in result.all():
+        counts[reaction] = int(count)
+        if is_own:
+            user_reaction = reaction
+    return counts, user_reaction
+
+
 async def set_reaction(
     db: AsyncSession, meme_id: int, user_name: str, reaction: str
-) -> None:
+) -> bool:
+    uploaded_by = await db.scalar(
+        select(Meme.uploaded_by).where(Meme.id == meme_id)
+    )
+    if uploaded_by is None:
+        return False
     result = await db.execute(
         select(MemeReaction).where(
             MemeReaction.meme_id == meme_id,
@@ -123,10 +196,23 @@ async def set_reaction(
     existing = result.scalars().first()
     if existing:
         if existing.reaction == reaction:
-            return
-        existing.reaction = reaction
+            return True
+        # Bedingtes UPDATE: bei zwei parallelen Wechseln gewinnt nur einer,
+        # sonst wuerden die Zaehler doppelt verschoben
+        result = await db.execute(
+            update(MemeReaction)
+            .where(
+                MemeReaction.id == existing.id,
+                MemeReaction.reaction == existing.reaction,
+            )
+            .values(reaction=reaction)
+        )
+        if result.rowcount == 1:
+            # Wechsel like <-> dislike: ein Zaehler hoch, der andere runter
+            delta = 1 if reaction == "like" else -1
+            await _bump_reaction_stats(db, uploaded_by, likes=delta, dislikes=-delta)
         await db.commit()
-        return
+        return True
     db.add(
         MemeReaction(
             meme_id=meme_id,
@@ -134,17 +220,284 @@ async def set_reaction(
             reaction=reaction,
         )
     )
+    try:
+        await db.flush()
+    except IntegrityError:
+        # Parallel schon angelegt (Doppelklick): als Wechsel erneut versuchen
+        await db.rollback()
+        return await set_reaction(db, meme_id, user_name, reaction)
+    await _bump_reaction_stats(
+        db,
+        uploaded_by,
+        likes=int(reaction == "like"),
+        dislikes=int(reaction == "dislike"),
+    )
     await db.commit()
+    return True
 
 
 async def delete_meme(db: AsyncSession, meme_id: int) -> None:
-    await db.execute(
-        delete(MemeReaction).where(MemeReaction.meme_id == meme_id)
+    # db.get nutzt die Identity Map, die Route hat das Meme meist schon geladen
+    meme = await db.get(Meme, meme_id)
+    if meme is None:
+        return
+    # Reaktionen zuerst (sonst raeumt Postgres sie per ON DELETE CASCADE ab,
+    # bevor RETURNING sie zaehlen kann). Nur wer das Meme wirklich loescht,
+    # zieht die Aggregate ab, ein paralleler Doppelklick rollt zurueck.
+    deleted_reactions = await db.execute(
+        delete(MemeReaction)
+        .where(MemeReaction.meme_id == meme_id)
+        .returning(MemeReaction.reaction)
+    )
+    reactions = list(deleted_reactions.scalars().all())
+    result = await db.execute(delete(Meme).where(Meme.id == meme_id))
+    if result.rowcount != 1:
+        await db.rollback()
+        return
+    await _bump_upload_stats(db, "memes", meme.uploaded_by, meme.created_at, -1)
+    await _bump_reaction_stats(
+        db,
+        meme.uploaded_by,
+        likes=-reactions.count("like"),
+        dislikes=-reactions.count("dislike"),
     )
-    await db.execute(delete(Meme).where(Meme.id == meme_id))
     await db.commit()
 
 
 async def delete_template(db: AsyncSession, template_id: int) -> None:
-    await db.execute(delete(MemeTemplate).where(MemeTemplate.id == template_id))
+    template = await db.get(MemeTemplate, template_id)
+    if template is None:
+        return
+    result = await db.execute(
+        delete(MemeTemplate).where(MemeTemplate.id == template_id)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        return
+    await _bump_upload_stats(
+        db, "templates", template.uploaded_by, template.created_at, -1
+    )
+    await db.commit()
+
+
+def _upload_day(created_at: datetime) -> date:
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date()
+
+
+async def _bump_counters(
+    db: AsyncSession, model: Any, keys: dict[str, Any], **deltas: int
+) -> None:
+    # Upsert "spalte = spalte + delta", damit parallele Schreiber sich nicht
+    # gegenseitig ueberschreiben (Postgres und SQLite kennen ON CONFLICT)
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        insert = postgresql_insert
+    else:
+        insert = sqlite_insert
+    statement = insert(model).values(**keys, **deltas)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            name: getattr(model, name) + value for name, value in deltas.items()
+        },
+    )
+    await db.execute(statement)
+
+
+async def _bump_upload_stats(
+    db: AsyncSession,
+    kind: str,
+    uploaded_by: str,
+    created_at: datetime,
+    delta: int,
+) -> None:
+    await _bump_counters(db, ArchiveStats, {"id": STATS_ROW_ID}, **{kind: delta})
+    await _bump_counters(
+        db, UploaderStats, {"user_name": uploaded_by}, **{kind: delta}
+    )
+    await _bump_counters(
+        db, DailyUploadStats, {"day": _upload_day(created_at)}, **{kind: delta}
+    )
+
+
+async def _bump_reaction_stats(
+    db: AsyncSession, uploaded_by: str, likes: int, dislikes: int
+) -> None:
+    await _bump_counters(
+        db, ArchiveStats, {"id": STATS_ROW_ID}, likes=likes, dislikes=dislikes
+    )
+    await _bump_counters(
+        db,
+        UploaderStats,
+        {"user_name": uploaded_by},
+        likes_received=likes,
+        dislikes_received=dislikes,
+    )
+
+
+def _like_ratio(likes: int, dislikes: int) -> Optional[float]:
+    if likes + dislikes == 0:
+        return None
+    return likes / (likes + dislikes)
+
+
+async def has_stats(db: AsyncSession) -> bool:
+    return await db.get(ArchiveStats, STATS_ROW_ID) is not None
+
+
+async def get_stats_dashboard(db: AsyncSession) -> dict[str, Any]:
+    # Liest nur die Aggregat-Tabellen: eine Zeile Totals, Top-N Uploader und
+    # ein festes Tagesfenster, unabhaengig von der Groesse des Archivs
+    totals = await get_meme_stats(db)
+    leaderboard_result = await db.execute(
+        select(UploaderStats)
+        .order_by(
+            UploaderStats.memes.desc(),
+            UploaderStats.likes_received.desc(),
+            UploaderStats.user_name,
+        )
+        .limit(LEADERBOARD_LIMIT)
+    )
+    leaderboard = [
+        {
+            "user_name": row.user_name,
+            "memes": row.memes,
+            "templates": row.templates,
+            "likes": row.likes_received,
+            "dislikes": row.dislikes_received,
+            "like_ratio": _like_ratio(row.likes_received, row.dislikes_received),
+        }
+        for row in leaderboard_result.scalars().all()
+    ]
+    today = datetime.now(timezone.utc).date()
+    first_day = today - timedelta(days=DAILY_UPLOADS_DAYS - 1)
+    daily_result = await db.execute(
+        select(DailyUploadStats).where(
+            DailyUploadStats.day >= first_day,
+            DailyUploadStats.day <= today,
+        )
+    )
+    daily_rows = {row.day: row for row in daily_result.scalars().all()}
+    daily_uploads = []
+    for offset in range(DAILY_UPLOADS_DAYS):
+        day = first_day + timedelta(days=offset)
+        row = daily_rows.get(day)
+        daily_uploads.append(
+            {
+                "day": day,
+                "memes": row.memes if row else 0,
+                "templates": row.templates if row else 0,
+            }
+        )
+    return {
+        "totals": totals,
+        "like_ratio": _like_ratio(totals["likes"], totals["dislikes"]),
+        "leaderboard": leaderboard,
+        "daily_uploads": daily_uploads,
+    }
+
+
+async def _compute_stats(db: AsyncSession) -> dict[str, Any]:
+    totals = {"templates": 0, "memes": 0, "likes": 0, "dislikes": 0}
+    uploaders: dict[str, dict[str, int]] = {}
+    days: dict[date, dict[str, int]] = {}
+
+    def uploader(name: str) -> dict[str, int]:
+        return uploaders.setdefault(
+            name,
+            {
+                "templates": 0,
+                "memes": 0,
+                "likes_received": 0,
+                "dislikes_received": 0,
+            },
+        )
+
+    for model, kind in ((MemeTemplate, "templates"), (Meme, "memes")):
+        result = await db.execute(select(model.uploaded_by, model.created_at))
+        for uploaded_by, created_at in result.all():
+            totals[kind] += 1
+            uploader(uploaded_by)[kind] += 1
+            day = days.setdefault(
+                _upload_day(created_at), {"templates": 0, "memes": 0}
+            )
+            day[kind] += 1
+
+    result = await db.execute(
+        select(Meme.uploaded_by, MemeReaction.reaction, func.count())
+        .join(Meme, Meme.id == MemeReaction.meme_id)
+        .group_by(Meme.uploaded_by, MemeReaction.reaction)
+    )
+    for uploaded_by, reaction, count in result.all():
+        total_column = "likes" if reaction == "like" else "dislikes"
+        totals[total_column] += int(count)
+        uploader(uploaded_by)[f"{total_column}_received"] += int(count)
+
+    return {"totals": totals, "uploaders": uploaders, "days": days}
+
+
+async def _load_stats(db: AsyncSession) -> dict[str, Any]:
+    row = await db.get(ArchiveStats, STATS_ROW_ID)
+    totals = {
+        "templates": row.templates if row else 0,
+        "memes": row.memes if row else 0,
+        "likes": row.likes if row else 0,
+        "dislikes": row.dislikes if row else 0,
+    }
+    result = await db.execute(select(UploaderStats))
+    uploaders = {
+        item.user_name: {
+            "templates": item.templates,
+            "memes": item.memes,
+            "likes_received": item.likes_received,
+            "dislikes_received": item.dislikes_received,
+        }
+        for item in result.scalars().all()
+    }
+    result = await db.execute(select(DailyUploadStats))
+    days = {
+        item.day: {"templates": item.templates, "memes": item.memes}
+        for item in result.scalars().all()
+    }
+    return {"totals": totals, "uploaders": uploaders, "days": days}
+
+
+def _without_zero_rows(rows: dict[Any, dict[str, int]]) -> dict[Any, dict[str, int]]:
+    return {key: values for key, values in rows.items() if any(values.values())}
+
+
+async def verify_stats(db: AsyncSession) -> list[str]:
+    expected = await _compute_stats(db)
+    stored = await _load_stats(db)
+    problems = []
+    if expected["totals"] != stored["totals"]:
+        problems.append(
+            f"totals: erwartet {expected['totals']}, gespeichert {stored['totals']}"
+        )
+    for section in ("uploaders", "days"):
+        expected_rows = _without_zero_rows(expected[section])
+        stored_rows = _without_zero_rows(stored[section])
+        for key in sorted(set(expected_rows) | set(stored_rows), key=str):
+            if expected_rows.get(key) != stored_rows.get(key):
+                problems.append(
+                    f"{section}[{key}]: erwartet {expected_rows.get(key)}, "
+                    f"gespeichert {stored_rows.get(key)}"
+                )
+    return problems
+
+
+async def rebuild_stats(db: AsyncSession) -> None:
+    computed = await _compute_stats(db)
+    await db.execute(delete(ArchiveStats))
+    await db.execute(delete(UploaderStats))
+    await db.execute(delete(DailyUploadStats))
+    db.add(ArchiveStats(id=STATS_ROW_ID, **computed["totals"]))
+    for user_name, values in computed["uploaders"].items():
+        db.add(UploaderStats(user_name=user_name, **values))
+    for day, values in computed["days"].items():
+        db.add(DailyUploadStats(day=day, **values))
     await db.commit()
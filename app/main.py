@@ -3,21 +3,46 @@ import hmac
 import json
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
 from urllib.parse import quote, unquote
 
 from fastapi import Depends, FastAPI, File, Form, Request, UploadFile
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    Response,
+)
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from starlette.concurrency import run_in_threadpool
 from starlette.templating import Jinja2Templates
 
-from app import logic
-from app.db import engine, get_db
-from app.models import Base
+from app import images, logic, resumable
+from app.db import (
+    AsyncSessionLocal,
+    ReadYourWritesMiddleware,
+    ReplicaSessionLocal,
+    engine,
+    get_db,
+    get_read_db,
+    replica_engine,
+)
+from app.limits import MAX_UPLOAD_BYTES, AdmissionControlMiddleware, admission
+from app.models import upgrade_schema
+from app.tracing import (
+    SQLTracingMiddleware,
+    TracedTemplate,
+    install_sql_tracing,
+    query_budget,
+)
 
 
 app = FastAPI(title="Luki Memes")
+install_sql_tracing(engine)
+if replica_engine is not engine:
+    install_sql_tracing(replica_engine)
 
 
 APP_PASSWORD = os.getenv("APP_PASSWORD", "21022026")
@@ -34,14 +59,30 @@ MEME_DIR = UPLOAD_ROOT / "memes"
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 
 
+async def prepare_database(
+    db_engine: AsyncEngine, session_factory: async_sessionmaker[AsyncSession]
+) -> None:
+    async with db_engine.begin() as conn:
+        await conn.run_sync(upgrade_schema)
+    async with session_factory() as session:
+        # Bestehende Datenbanken ohne Aggregate einmalig nachrechnen
+        if not await logic.has_stats(session):
+            await logic.rebuild_stats(session)
+
+
 @app.on_event("startup")
 async def on_startup() -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    resumable.expire_uploads()
+    await prepare_database(engine, AsyncSessionLocal)
+    # Ein lokales SQLite-Replica ist nur eine Dateikopie und braucht dasselbe
+    # Schema; ein Postgres-Standby ist read-only und bekommt es per Replikation
+    if replica_engine is not engine and replica_engine.dialect.name == "sqlite":
+        await prepare_database(replica_engine, ReplicaSessionLocal)
 
 
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+templates.env.template_class = TracedTemplate
 try:
     templates.env.globals["asset_version"] = int(
         (BASE_DIR / "static" / "styles.css").stat().st_mtime
@@ -72,31 +113,58 @@ def get_current_user(request: Request) -> Optional[str]:
     return name
 
 
+app.add_middleware(
+    AdmissionControlMiddleware,
+    controller=admission,
+    user_resolver=get_current_user,
+)
+app.add_middleware(ReadYourWritesMiddleware)
+# Zuletzt hinzugefuegt = aeusserste Middleware, misst also die ganze Anfrage
+app.add_middleware(SQLTracingMiddleware)
+
+
+def wants_fragment(request: Request) -> bool:
+    # Progressive Enhancement: fetch() fragt JSON an, normale Formulare nicht
+    return "application/json" in request.headers.get("accept", "")
+
+
 def ensure_upload_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
-def validate_upload_file(upload: UploadFile) -> Optional[str]:
-    if not upload or not upload.filename:
+def validate_filename(filename: Optional[str]) -> Optional[str]:
+    if not filename:
         return "Bitte waehle eine Datei aus."
-    extension = os.path.splitext(upload.filename)[1].lower()
+    extension = os.path.splitext(filename)[1].lower()
     if extension not in ALLOWED_EXTENSIONS:
         return "Bitte nur Bilddateien (jpg, png, gif, webp) hochladen."
     return None
 
 
+def validate_upload_file(upload: UploadFile) -> Optional[str]:
+    if not upload:
+        return "Bitte waehle eine Datei aus."
+    return validate_filename(upload.filename)
+
+
+def new_upload_path(
+    destination: Path, original_name: Optional[str]
+) -> tuple[Path, str]:
+    ensure_upload_dir(destination)
+    extension = os.path.splitext(original_name or "")[1].lower()
+    filename = f"{hashlib.sha256(os.urandom(16)).hexdigest()}{extension}"
+    return destination / filename, f"uploads/{destination.name}/{filename}"
+
+
 async def save_upload_file(
     upload: UploadFile, destination: Path
 ) -> tuple[str, Optional[str]]:
-    ensure_upload_dir(destination)
     original_name = upload.filename or None
-    extension = os.path.splitext(original_name or "")[1].lower()
-    filename = f"{hashlib.sha256(os.urandom(16)).hexdigest()}{extension}"
-    file_path = destination / filename
+    file_path, relative_path = new_upload_path(destination, original_name)
     contents = await upload.read()
     with open(file_path, "wb") as handle:
         handle.write(contents)
-    return f"uploads/{destination.name}/{filename}", original_name
+    return relative_path, original_name
 
 
 @app.get("/login", response_class=HTMLResponse, name="login")
@@ -178,7 +246,8 @@ async def logout():
 
 
 @app.get("/", response_class=HTMLResponse, name="home")
-async def home(request: Request, db: AsyncSession = Depends(get_db)):
+@query_budget(1)
+async def home(request: Request, db: AsyncSession = Depends(get_read_db)):
     current_user = get_current_user(request)
     if not current_user:
         return RedirectResponse("/login", status_code=303)
@@ -193,8 +262,33 @@ async def home(request: Request, db: AsyncSession = Depends(get_db)):
     )
 
 
+@app.get("/stats", response_class=HTMLResponse, name="stats")
+@query_budget(3)
+async def stats_dashboard(request: Request, db: AsyncSession = Depends(get_read_db)):
+    current_user = get_current_user(request)
+    if not current_user:
+        return RedirectResponse("/login", status_code=303)
+    dashboard = await logic.get_stats_dashboard(db)
+    max_daily = max(
+        (day["memes"] + day["templates"] for day in dashboard["daily_uploads"]),
+        default=0,
+    )
+    return templates.TemplateResponse(
+        "stats.html",
+        {
+            "request": request,
+            "current_user": current_user,
+            "title": "Statistik",
+            "dashboard": dashboard,
+            "max_daily": max_daily,
+            "admission": admission.snapshot(),
+        },
+    )
+
+
 @app.get("/templates", response_class=HTMLResponse, name="templates_list")
-async def templates_list(request: Request, db: AsyncSession = Depends(get_db)):
+@query_budget(1)
+async def templates_list(request: Request, db: AsyncSession = Depends(get_read_db)):
     current_user = get_current_user(request)
     if not current_user:
         return RedirectResponse("/login", status_code=303)
@@ -205,6 +299,9 @@ async def templates_list(request: Request, db: AsyncSession = Depends(get_db)):
             "title": item.title,
             "uploaded_by": item.uploaded_by,
             "file_url": f"/static/{item.file_path}",
+            "width": item.width,
+            "height": item.height,
+            "placeholder": item.placeholder,
         }
         for item in templates_list
     ]
@@ -243,6 +340,7 @@ async def templates_upload_page(request: Request):
 
 
 @app.post("/templates/upload", response_class=HTMLResponse)
+@query_budget(5)
 async def templates_upload_submit(
     request: Request,
     title: str = Form(...),
@@ -279,17 +377,21 @@ async def templates_upload_submit(
             },
         )
     file_path, original_name = await save_upload_file(file, TEMPLATE_DIR)
+    metadata = await run_in_threadpool(
+        images.read_image_metadata, BASE_DIR / "static" / file_path
+    )
     await logic.create_template(
-        db, clean_title, file_path, original_name, current_user
+        db, clean_title, file_path, original_name, current_user, metadata
     )
     return RedirectResponse("/templates", status_code=303)
 
 
 @app.get("/templates/{template_id}", response_class=HTMLResponse, name="template_detail")
+@query_budget(1)
 async def template_detail(
     request: Request,
     template_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     current_user = get_current_user(request)
     if not current_user:
@@ -314,6 +416,9 @@ async def build_template_detail_context(
         "current_user": current_user,
         "title": item.title,
         "file_url": f"/static/{item.file_path}",
+        "width": item.width,
+        "height": item.height,
+        "placeholder": item.placeholder,
         "uploaded_by": item.uploaded_by,
         "back_url": "/templates",
         "download_url": f"/static/{item.file_path}",
@@ -325,7 +430,8 @@ async def build_template_detail_context(
 
 
 @app.get("/memes", response_class=HTMLResponse, name="memes_list")
-async def memes_list(request: Request, db: AsyncSession = Depends(get_db)):
+@query_budget(3)
+async def memes_list(request: Request, db: AsyncSession = Depends(get_read_db)):
     current_user = get_current_user(request)
     if not current_user:
         return RedirectResponse("/login", status_code=303)
@@ -339,6 +445,9 @@ async def memes_list(request: Request, db: AsyncSession = Depends(get_db)):
             "title": item.title,
             "uploaded_by": item.uploaded_by,
             "file_url": f"/static/{item.file_path}",
+            "width": item.width,
+            "height": item.height,
+            "placeholder": item.placeholder,
             "likes": reaction_counts.get(item.id, {}).get("like", 0),
             "dislikes": reaction_counts.get(item.id, {}).get("dislike", 0),
             "user_reaction": user_reactions.get(item.id),
@@ -380,6 +489,7 @@ async def memes_upload_page(request: Request):
 
 
 @app.post("/memes/upload", response_class=HTMLResponse)
+@query_budget(5)
 async def memes_upload_submit(
     request: Request,
     title: str = Form(...),
@@ -416,7 +526,12 @@ async def memes_upload_submit(
             },
         )
     file_path, original_name = await save_upload_file(file, MEME_DIR)
-    await logic.create_meme(db, clean_title, file_path, original_name, current_user)
+    metadata = await run_in_threadpool(
+        images.read_image_metadata, BASE_DIR / "static" / file_path
+    )
+    await logic.create_meme(
+        db, clean_title, file_path, original_name, current_user, metadata
+    )
     return RedirectResponse("/memes", status_code=303)
 
 
@@ -427,22 +542,25 @@ async def build_meme_detail_context(
     db: AsyncSession,
     delete_error: Optional[str],
 ) -> dict:
-    reaction_counts = await logic.get_reaction_counts(db, [item.id])
-    user_reactions = await logic.get_user_reactions(db, [item.id], current_user)
-    meme_counts = reaction_counts.get(item.id, {"like": 0, "dislike": 0})
+    meme_counts, user_reaction = await logic.get_reaction_summary(
+        db, item.id, current_user
+    )
     return {
         "request": request,
         "current_user": current_user,
         "title": item.title,
         "file_url": f"/static/{item.file_path}",
+        "width": item.width,
+        "height": item.height,
+        "placeholder": item.placeholder,
         "uploaded_by": item.uploaded_by,
         "back_url": "/memes",
         "download_url": f"/static/{item.file_path}",
         "show_reactions": True,
         "meme_id": item.id,
-        "likes": meme_counts.get("like", 0),
-        "dislikes": meme_counts.get("dislike", 0),
-        "user_reaction": user_reactions.get(item.id),
+        "likes": meme_counts["like"],
+        "dislikes": meme_counts["dislike"],
+        "user_reaction": user_reaction,
         "show_delete": True,
         "delete_action": f"/memes/{item.id}/delete",
         "delete_error": delete_error,
@@ -450,10 +568,11 @@ async def build_meme_detail_context(
 
 
 @app.get("/memes/{meme_id}", response_class=HTMLResponse, name="meme_detail")
+@query_budget(2)
 async def meme_detail(
     request: Request,
     meme_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     current_user = get_current_user(request)
     if not current_user:
@@ -468,6 +587,7 @@ async def meme_detail(
 
 
 @app.post("/memes/{meme_id}/react")
+@query_budget(6)
 async def meme_react(
     request: Request,
     meme_id: int,
@@ -479,15 +599,27 @@ async def meme_react(
         return RedirectResponse("/login", status_code=303)
     if reaction not in {"like", "dislike"}:
         return RedirectResponse(f"/memes/{meme_id}", status_code=303)
-    item = await logic.get_meme(db, meme_id)
-    if not item:
+    # set_reaction prueft selbst, ob das Meme existiert
+    if not await logic.set_reaction(db, meme_id, current_user, reaction):
+        if wants_fragment(request):
+            return JSONResponse({"error": "not_found"}, status_code=404)
         return RedirectResponse("/memes", status_code=303)
-    await logic.set_reaction(db, meme_id, current_user, reaction)
+    if wants_fragment(request):
+        counts = (await logic.get_reaction_counts(db, [meme_id]))[meme_id]
+        return JSONResponse(
+            {
+                "meme_id": meme_id,
+                "likes": counts["like"],
+                "dislikes": counts["dislike"],
+                "user_reaction": reaction,
+            }
+        )
     redirect_target = request.headers.get("referer") or f"/memes/{meme_id}"
     return RedirectResponse(redirect_target, status_code=303)
 
 
 @app.post("/memes/{meme_id}/delete")
+@query_budget(9)
 async def meme_delete(
     request: Request,
     meme_id: int,
@@ -519,6 +651,7 @@ async def meme_delete(
 
 
 @app.post("/templates/{template_id}/delete")
+@query_budget(5)
 async def template_delete(
     request: Request,
     template_id: int,
@@ -549,7 +682,8 @@ async def template_delete(
 
 
 @app.get("/slideshow", response_class=HTMLResponse, name="slideshow")
-async def slideshow(request: Request, db: AsyncSession = Depends(get_db)):
+@query_budget(2)
+async def slideshow(request: Request, db: AsyncSession = Depends(get_read_db)):
     current_user = get_current_user(request)
     if not current_user:
         return RedirectResponse("/login", status_code=303)
@@ -574,3 +708,165 @@ async def slideshow(request: Request, db: AsyncSession = Depends(get_db)):
             "memes_json": json.dumps(entries),
         },
     )
+
+
+# Resumable Uploads im Stil von tus (https://tus.io): POST legt an, HEAD liefert
+# den Offset, PATCH haengt einen Chunk an, der letzte Chunk erzeugt das Meme
+def tus_headers(**headers: str) -> dict[str, str]:
+    return {
+        "Tus-Resumable": resumable.TUS_VERSION,
+        "Cache-Control": "no-store",
+        **headers,
+    }
+
+
+def tus_error(status_code: int, message: str) -> PlainTextResponse:
+    return PlainTextResponse(message, status_code=status_code, headers=tus_headers())
+
+
+@app.post("/uploads")
+@query_budget(0)
+async def resumable_create(request: Request):
+    current_user = get_current_user(request)
+    if not current_user:
+        return tus_error(401, "Bitte zuerst einloggen.")
+    upload_length = request.headers.get("upload-length", "")
+    if not upload_length.isdigit():
+        return tus_error(400, "Upload-Length fehlt.")
+    length = int(upload_length)
+    if length > MAX_UPLOAD_BYTES:
+        return tus_error(413, "Die Datei ist zu gross.")
+    try:
+        metadata = resumable.parse_metadata(request.headers.get("upload-metadata", ""))
+    except resumable.UploadError as error:
+        return tus_error(error.status_code, error.message)
+    if metadata.get("kind") not in {"meme", "template"}:
+        return tus_error(400, "Upload-Metadata 'kind' muss meme oder template sein.")
+    metadata["title"] = metadata.get("title", "").strip()
+    if not metadata["title"]:
+        return tus_error(400, "Bitte gib einen Titel an.")
+    upload_error = validate_filename(metadata.get("filename"))
+    if upload_error:
+        return tus_error(400, upload_error)
+    resumable.expire_uploads()
+    upload_id = resumable.create_upload(current_user, length, metadata)
+    return Response(
+        status_code=201,
+        headers=tus_headers(Location=f"/uploads/{upload_id}"),
+    )
+
+
+@app.head("/uploads/{upload_id}")
+@query_budget(0)
+async def resumable_offset(request: Request, upload_id: str):
+    current_user = get_current_user(request)
+    if not current_user:
+        return Response(status_code=401, headers=tus_headers())
+    await resumable.wait_for_finish(upload_id)
+    info = resumable.load_upload(upload_id, current_user)
+    if not info:
+        return Response(status_code=404, headers=tus_headers())
+    headers = tus_headers(
+        **{
+            "Upload-Offset": str(info["offset"]),
+            "Upload-Length": str(info["length"]),
+        }
+    )
+    if "result" in info:
+        headers["Upload-Result"] = info["result"]
+    return Response(status_code=200, headers=headers)
+
+
+@app.patch("/uploads/{upload_id}")
+@query_budget(5)
+async def resumable_chunk(
+    request: Request,
+    upload_id: str,
+    db: AsyncSession = Depends(get_db),
+):
+    current_user = get_current_user(request)
+    if not current_user:
+        return tus_error(401, "Bitte zuerst einloggen.")
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        return tus_error(415, "Content-Type muss application/offset+octet-stream sein.")
+    info = resumable.load_upload(upload_id, current_user)
+    if not info:
+        return tus_error(404, "Upload nicht gefunden oder abgelaufen.")
+    if "result" in info:
+        # Wiederholter letzter Chunk, dessen Antwort verloren ging
+        return Response(
+            status_code=204,
+            headers=tus_headers(
+                **{
+                    "Upload-Offset": str(info["offset"]),
+                    "Upload-Result": info["result"],
+                }
+            ),
+        )
+    upload_offset = request.headers.get("upload-offset", "")
+    if not upload_offset.isdigit():
+        return tus_error(400, "Upload-Offset fehlt.")
+    lock = resumable.upload_lock(upload_id)
+    if lock.locked():
+        return tus_error(409, "Fuer diesen Upload laeuft bereits ein Chunk.")
+    async with lock:
+        try:
+            checksum = resumable.parse_checksum(request.headers.get("upload-checksum"))
+            offset = await resumable.append_chunk(
+                upload_id, info, int(upload_offset), request.stream(), checksum
+            )
+        except resumable.UploadError as error:
+            return tus_error(error.status_code, error.message)
+        headers = tus_headers(**{"Upload-Offset": str(offset)})
+        if offset < info["length"]:
+            return Response(status_code=204, headers=headers)
+        headers["Upload-Result"] = await finish_resumable_upload(
+            db, upload_id, info, current_user
+        )
+    return Response(status_code=204, headers=headers)
+
+
+async def finish_resumable_upload(
+    db: AsyncSession, upload_id: str, info: dict[str, Any], current_user: str
+) -> str:
+    # Letzter Chunk: Datei an ihren endgueltigen Platz verschieben und wie ein
+    # normaler Upload anlegen
+    metadata = info["metadata"]
+    is_meme = metadata["kind"] == "meme"
+    original_name = metadata["filename"]
+    destination, file_path = new_upload_path(
+        MEME_DIR if is_meme else TEMPLATE_DIR, original_name
+    )
+    resumable.finish_upload(upload_id, destination)
+    try:
+        image_metadata = await run_in_threadpool(
+            images.read_image_metadata, destination
+        )
+        create = logic.create_meme if is_meme else logic.create_template
+        await create(
+            db,
+            metadata["title"],
+            file_path,
+            original_name,
+            current_user,
+            image_metadata,
+        )
+    except BaseException:
+        # Auch bei Abbruch: nichts in static/uploads liegen lassen
+        resumable.restore_upload(upload_id, destination)
+        raise
+    result = "/memes" if is_meme else "/templates"
+    resumable.complete_upload(upload_id, info, result)
+    return result
+
+
+@app.delete("/uploads/{upload_id}")
+@query_budget(0)
+async def resumable_cancel(request: Request, upload_id: str):
+    current_user = get_current_user(request)
+    if not current_user:
+        return tus_error(401, "Bitte zuerst einloggen.")
+    if not resumable.load_upload(upload_id, current_user):
+        return tus_error(404, "Upload nicht gefunden oder abgelaufen.")
+    resumable.delete_upload(upload_id)
+    return Response(status_code=204, headers=tus_headers())
@@ -1,7 +1,18 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, UniqueConstraint, func
+from sqlalchemy import (
+    Connection,
+    Date,
+    DateTime,
+    ForeignKey,
+    Integer,
+    String,
+    UniqueConstraint,
+    func,
+    inspect,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -9,7 +20,20 @@ class Base(DeclarativeBase):
     pass
 
 
-class MemeTemplate(Base):
+class ImageMetadataMixin:
+    # Beim Upload einmal ausgelesen, damit die Grids ohne Reflow rendern
+    width: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    height: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    byte_size: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    image_format: Mapped[Optional[str]] = mapped_column(
+        String(length=16), nullable=True
+    )
+    placeholder: Mapped[Optional[str]] = mapped_column(
+        String(length=2048), nullable=True
+    )
+
+
+class MemeTemplate(ImageMetadataMixin, Base):
     __tablename__ = "meme_templates"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -24,7 +48,7 @@ class MemeTemplate(Base):
     )
 
 
-class Meme(Base):
+class Meme(ImageMetadataMixin, Base):
     __tablename__ = "memes"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -54,3 +78,56 @@ class MemeReaction(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
+
+
+# Aggregat-Tabellen, werden von den Schreibpfaden in logic.py mitgepflegt
+class ArchiveStats(Base):
+    __tablename__ = "archive_stats"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    templates: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    memes: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    likes: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    dislikes: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class UploaderStats(Base):
+    __tablename__ = "uploader_stats"
+
+    user_name: Mapped[str] = mapped_column(String(length=120), primary_key=True)
+    templates: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    memes: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False, index=True
+    )
+    likes_received: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    dislikes_received: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False
+    )
+
+
+class DailyUploadStats(Base):
+    __tablename__ = "daily_upload_stats"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    templates: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    memes: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+def upgrade_schema(connection: Connection) -> None:
+    # Kein Alembic: neue Tabellen per create_all, neue (nullable) Spalten
+    # bestehender Tabellen werden hier nachgezogen
+    Base.metadata.create_all(connection)
+    inspector = inspect(connection)
+    quote = connection.dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(
+                text(
+                    f"ALTER TABLE {quote(table.name)} "
+                    f"ADD COLUMN {quote(column.name)} {column_type}"
+                )
+            )
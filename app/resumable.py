@@ -0,0 +1,211 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any, Optional
+
+from starlette.requests import ClientDisconnect
+
+# Unfertige Uploads liegen bewusst ausserhalb von static/, damit sie nie
+# oeffentlich ausgeliefert werden
+PARTIAL_UPLOAD_DIR = Path(
+    os.getenv(
+        "PARTIAL_UPLOAD_DIR",
+        str(Path(__file__).resolve().parent / "partial_uploads"),
+    )
+)
+UPLOAD_EXPIRE_SECONDS = int(os.getenv("UPLOAD_EXPIRE_SECONDS", str(24 * 60 * 60)))
+TUS_VERSION = "1.0.0"
+UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+_locks: dict[str, asyncio.Lock] = {}
+# Uploads, deren letzter Chunk gerade zu Meme / Template verarbeitet wird
+_finalizing: set[str] = set()
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def parse_metadata(header: str) -> dict[str, str]:
+    # tus Format: "key base64wert,key base64wert"
+    metadata = {}
+    for pair in header.split(","):
+        pair = pair.strip()
+        if not pair:
+            continue
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(400, f"Upload-Metadata '{key}' ist ungueltig.") from None
+    return metadata
+
+
+def parse_checksum(header: Optional[str]) -> Optional[bytes]:
+    if not header:
+        return None
+    algorithm, _, value = header.partition(" ")
+    if algorithm.lower() != "sha256":
+        raise UploadError(400, "Nur sha256 wird als Upload-Checksum unterstuetzt.")
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error:
+        raise UploadError(400, "Upload-Checksum ist ungueltig.") from None
+
+
+def _data_path(upload_id: str) -> Path:
+    return PARTIAL_UPLOAD_DIR / f"{upload_id}.bin"
+
+
+def _info_path(upload_id: str) -> Path:
+    return PARTIAL_UPLOAD_DIR / f"{upload_id}.json"
+
+
+def create_upload(owner: str, length: int, metadata: dict[str, str]) -> str:
+    PARTIAL_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    _data_path(upload_id).touch()
+    info = {"owner": owner, "length": length, "metadata": metadata}
+    _info_path(upload_id).write_text(json.dumps(info), encoding="utf-8")
+    return upload_id
+
+
+def load_upload(upload_id: str, owner: str) -> Optional[dict[str, Any]]:
+    if not UPLOAD_ID.match(upload_id):
+        return None
+    try:
+        info = json.loads(_info_path(upload_id).read_text(encoding="utf-8"))
+        # Fertige Uploads haben keine Datendatei mehr, nur noch das Ergebnis
+        if "result" in info:
+            offset = info["length"]
+        else:
+            offset = _data_path(upload_id).stat().st_size
+    except (FileNotFoundError, ValueError):
+        return None
+    if info["owner"] != owner:
+        return None
+    info["offset"] = offset
+    return info
+
+
+def expires_at(upload_id: str) -> float:
+    return _data_path(upload_id).stat().st_mtime + UPLOAD_EXPIRE_SECONDS
+
+
+def upload_lock(upload_id: str) -> asyncio.Lock:
+    # Ein Chunk samt Abschluss pro Upload gleichzeitig; die Route haelt den Lock
+    # ueber append_chunk, finish_upload und complete_upload hinweg
+    return _locks.setdefault(upload_id, asyncio.Lock())
+
+
+async def wait_for_finish(upload_id: str) -> None:
+    # Waehrend des Abschlusses fehlt die Datendatei schon, ein HEAD wartet
+    # deshalb auf das Ergebnis, statt den Upload als unbekannt zu melden
+    lock = _locks.get(upload_id)
+    if upload_id in _finalizing and lock is not None:
+        async with lock:
+            pass
+
+
+async def append_chunk(
+    upload_id: str,
+    info: dict[str, Any],
+    offset: int,
+    chunks: AsyncIterator[bytes],
+    checksum: Optional[bytes],
+) -> int:
+    # Nur unter upload_lock aufrufen, sonst koennten sich zwei PATCHes mit
+    # demselben Offset ueberholen
+    current = _data_path(upload_id).stat().st_size
+    if offset != current:
+        raise UploadError(409, f"Upload-Offset ist {current}, nicht {offset}.")
+    digest = hashlib.sha256()
+    written = 0
+    complete = False
+    # Direkt ans Ende der Datei schreiben, ohne den Chunk im Speicher zu sammeln
+    with open(_data_path(upload_id), "ab") as handle:
+        try:
+            async for chunk in chunks:
+                if offset + written + len(chunk) > info["length"]:
+                    raise UploadError(400, "Chunk geht ueber Upload-Length hinaus.")
+                handle.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+            if checksum is not None and digest.digest() != checksum:
+                raise UploadError(460, "Checksumme des Chunks stimmt nicht.")
+            complete = True
+        except ClientDisconnect:
+            # Verbindung weg: ohne Checksumme bleibt der empfangene Praefix und
+            # der Client macht per HEAD ab dort weiter. Mit Checksumme laesst
+            # sich ein halber Chunk nicht pruefen, er wird unten verworfen.
+            complete = checksum is None
+        finally:
+            # Fehlerhafte oder unvollstaendige Chunks mit Checksumme wieder
+            # abschneiden, ohne Checksumme bleibt ein abgebrochener Rest erhalten
+            if not complete and checksum is not None:
+                handle.truncate(offset)
+                written = 0
+    return offset + written
+
+
+def finish_upload(upload_id: str, destination: Path) -> None:
+    _finalizing.add(upload_id)
+    shutil.move(str(_data_path(upload_id)), str(destination))
+
+
+def restore_upload(upload_id: str, destination: Path) -> None:
+    # Abschluss fehlgeschlagen: Datei zurueck, der Client wiederholt den
+    # letzten (leeren) Chunk und loest den Abschluss erneut aus
+    shutil.move(str(destination), str(_data_path(upload_id)))
+    _finalizing.discard(upload_id)
+
+
+def complete_upload(upload_id: str, info: dict[str, Any], result: str) -> None:
+    # Info bis zum Ablauf behalten: geht die Antwort auf den letzten Chunk
+    # verloren, erfaehrt der Client per HEAD trotzdem, dass alles fertig ist
+    completed = {key: value for key, value in info.items() if key != "offset"}
+    completed["result"] = result
+    temp_path = _info_path(upload_id).with_suffix(".tmp")
+    temp_path.write_text(json.dumps(completed), encoding="utf-8")
+    temp_path.replace(_info_path(upload_id))
+    _finalizing.discard(upload_id)
+    _locks.pop(upload_id, None)
+
+
+def delete_upload(upload_id: str) -> None:
+    for path in (_data_path(upload_id), _info_path(upload_id)):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+    _locks.pop(upload_id, None)
+
+
+def expire_uploads() -> int:
+    # Abgebrochene Uploads nach UPLOAD_EXPIRE_SECONDS ohne neuen Chunk wegraeumen
+    if not PARTIAL_UPLOAD_DIR.is_dir():
+        return 0
+    now = time.time()
+    expired = 0
+    for path in PARTIAL_UPLOAD_DIR.glob("*.json"):
+        upload_id = path.stem
+        if upload_id in _locks and _locks[upload_id].locked():
+            continue
+        data_path = _data_path(upload_id)
+        last_activity = (data_path if data_path.exists() else path).stat().st_mtime
+        if last_activity + UPLOAD_EXPIRE_SECONDS < now:
+            delete_upload(upload_id)
+            expired += 1
+    return expired
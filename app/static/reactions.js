@@ -0,0 +1,87 @@
+// Reaktionen ohne Seiten-Reload: das Formular funktioniert weiterhin ohne JS,
+// mit JS wird nur der eine Zaehler aktualisiert.
+function submitWithoutFetch(form, button) {
+  // form.submit() uebertraegt den geklickten Button nicht, daher als Feld anhaengen
+  const field = document.createElement("input");
+  field.type = "hidden";
+  field.name = button.name;
+  field.value = button.value;
+  form.appendChild(field);
+  form.submit();
+}
+
+async function showRateLimit(form, response) {
+  // Lastschutz (429): Hinweis anzeigen und die Buttons bis Retry-After sperren
+  let status = form.querySelector("[data-reaction-status]");
+  if (!status) {
+    status = document.createElement("span");
+    status.className = "text-sm text-slate-500";
+    status.dataset.reactionStatus = "";
+    form.appendChild(status);
+  }
+  status.textContent = (await response.text()) || "Zu viele Reaktionen, bitte kurz warten.";
+  const seconds = Number(response.headers.get("Retry-After")) || 1;
+  const buttons = form.querySelectorAll("button[name='reaction']");
+  buttons.forEach((item) => {
+    item.disabled = true;
+  });
+  setTimeout(() => {
+    buttons.forEach((item) => {
+      item.disabled = false;
+    });
+    status.textContent = "";
+  }, seconds * 1000);
+}
+
+document.querySelectorAll("[data-reaction-form]").forEach((form) => {
+  form.addEventListener("submit", async (event) => {
+    const button = event.submitter;
+    if (!button || !window.fetch) {
+      return;
+    }
+    event.preventDefault();
+    const body = new FormData(form);
+    body.set(button.name, button.value);
+    let response;
+    try {
+      response = await fetch(form.action, {
+        method: "POST",
+        body,
+        headers: { Accept: "application/json" },
+        credentials: "same-origin",
+      });
+    } catch (error) {
+      submitWithoutFetch(form, button);
+      return;
+    }
+    if (response.status === 429) {
+      await showRateLimit(form, response);
+      return;
+    }
+    if (!response.ok) {
+      submitWithoutFetch(form, button);
+      return;
+    }
+    const contentType = response.headers.get("Content-Type") || "";
+    if (response.redirected || !contentType.includes("application/json")) {
+      // Session abgelaufen oder ungueltige Reaktion: die Route leitet per 303
+      // auf eine HTML-Seite (Login, Detail) um, dorthin wie ohne JS navigieren
+      window.location.href = response.url;
+      return;
+    }
+    let data;
+    try {
+      data = await response.json();
+    } catch (error) {
+      submitWithoutFetch(form, button);
+      return;
+    }
+    form.querySelectorAll("button[name='reaction']").forEach((item) => {
+      const count = item.querySelector("[data-reaction-count]");
+      if (count) {
+        count.textContent = item.value === "like" ? data.likes : data.dislikes;
+      }
+      item.classList.toggle("active", item.value === data.user_reaction);
+    });
+  });
+});
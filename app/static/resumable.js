@@ -0,0 +1,171 @@
+// Resumable Upload (tus-Stil) fuer wackelige Verbindungen: die Datei geht in
+// Chunks raus, nach Abbruch oder Reload wird ab dem Server-Offset weitergemacht.
+// Ohne fetch/File API bleibt es beim normalen Formular-Upload.
+const CHUNK_SIZE = 1024 * 1024;
+const MAX_RETRIES = 20;
+
+function encodeMetadata(values) {
+  return Object.entries(values)
+    .map(([key, value]) => {
+      const bytes = new TextEncoder().encode(value);
+      return `${key} ${btoa(String.fromCharCode(...bytes))}`;
+    })
+    .join(",");
+}
+
+async function chunkChecksum(buffer) {
+  // crypto.subtle gibt es nur in sicheren Kontexten (https, localhost)
+  if (!window.crypto || !window.crypto.subtle) {
+    return null;
+  }
+  const digest = await window.crypto.subtle.digest("SHA-256", buffer);
+  return `sha256 ${btoa(String.fromCharCode(...new Uint8Array(digest)))}`;
+}
+
+function wait(ms) {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+async function responseMessage(response) {
+  const text = await response.text();
+  return text || `Upload fehlgeschlagen (${response.status}).`;
+}
+
+async function fetchState(url) {
+  // Upload-Result gesetzt: der Upload ist schon fertig, auch wenn die Antwort
+  // auf den letzten Chunk unterwegs verloren ging
+  const response = await fetch(url, { method: "HEAD", credentials: "same-origin" });
+  if (!response.ok) {
+    return null;
+  }
+  return {
+    offset: Number(response.headers.get("Upload-Offset")),
+    result: response.headers.get("Upload-Result"),
+  };
+}
+
+async function createUpload(file, kind, title) {
+  const response = await fetch("/uploads", {
+    method: "POST",
+    credentials: "same-origin",
+    headers: {
+      "Tus-Resumable": "1.0.0",
+      "Upload-Length": String(file.size),
+      "Upload-Metadata": encodeMetadata({ kind, title, filename: file.name }),
+    },
+  });
+  if (response.status !== 201) {
+    throw new Error(await responseMessage(response));
+  }
+  return response.headers.get("Location");
+}
+
+async function uploadResumable(file, kind, title, onProgress) {
+  const storageKey = `lm_upload:${kind}:${title}:${file.name}:${file.size}:${file.lastModified}`;
+  let url = localStorage.getItem(storageKey);
+  const state = url ? await fetchState(url) : null;
+  let offset = 0;
+  if (state && state.result) {
+    localStorage.removeItem(storageKey);
+    onProgress(1);
+    return state.result;
+  }
+  if (state) {
+    offset = state.offset;
+  } else {
+    url = await createUpload(file, kind, title);
+    localStorage.setItem(storageKey, url);
+  }
+
+  let retries = 0;
+  while (true) {
+    onProgress(offset / file.size);
+    const buffer = await file.slice(offset, offset + CHUNK_SIZE).arrayBuffer();
+    const headers = {
+      "Tus-Resumable": "1.0.0",
+      "Content-Type": "application/offset+octet-stream",
+      "Upload-Offset": String(offset),
+    };
+    const checksum = await chunkChecksum(buffer);
+    if (checksum) {
+      headers["Upload-Checksum"] = checksum;
+    }
+    let response = null;
+    try {
+      response = await fetch(url, {
+        method: "PATCH",
+        credentials: "same-origin",
+        headers,
+        body: buffer,
+      });
+    } catch (error) {
+      response = null;
+    }
+
+    if (response && response.status === 204) {
+      retries = 0;
+      offset = Number(response.headers.get("Upload-Offset"));
+      const result = response.headers.get("Upload-Result");
+      if (result) {
+        localStorage.removeItem(storageKey);
+        onProgress(1);
+        return result;
+      }
+      continue;
+    }
+    if (response && response.status === 404) {
+      localStorage.removeItem(storageKey);
+      throw new Error(await responseMessage(response));
+    }
+    // Netzwerkfehler, Lastschutz (429/503), Offset-Konflikt (409) oder
+    // Checksumme (460): kurz warten, Offset neu holen, weitermachen
+    const retryable =
+      !response || [409, 429, 460, 503].includes(response.status) || response.status >= 500;
+    if (!retryable || retries >= MAX_RETRIES) {
+      throw new Error(response ? await responseMessage(response) : "Keine Verbindung.");
+    }
+    retries += 1;
+    await wait(Math.min(30000, 1000 * 2 ** Math.min(retries - 1, 5)));
+    const serverState = await fetchState(url).catch(() => null);
+    if (serverState && serverState.result) {
+      localStorage.removeItem(storageKey);
+      onProgress(1);
+      return serverState.result;
+    }
+    if (serverState) {
+      offset = serverState.offset;
+    }
+  }
+}
+
+document.querySelectorAll("[data-resumable-upload]").forEach((form) => {
+  if (!window.fetch || !window.File || !window.localStorage || !window.TextEncoder) {
+    return;
+  }
+  const status = form.querySelector("[data-upload-status]");
+  const button = form.querySelector("button[type='submit']");
+  form.addEventListener("submit", async (event) => {
+    const file = form.elements.file.files[0];
+    const title = form.elements.title.value.trim();
+    if (!file || !title) {
+      return;
+    }
+    event.preventDefault();
+    button.disabled = true;
+    status.classList.remove("hidden");
+    try {
+      const result = await uploadResumable(
+        file,
+        form.dataset.uploadKind,
+        title,
+        (progress) => {
+          status.textContent = `Upload läuft: ${Math.round(progress * 100)} %`;
+        },
+      );
+      window.location.href = result;
+    } catch (error) {
+      status.textContent = error.message;
+      button.disabled = false;
+    }
+  });
+});
@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+import sys
+
+from app import logic
+from app.db import AsyncSessionLocal, engine
+from app.models import upgrade_schema
+
+
+async def run(command: str) -> int:
+    try:
+        return await check_or_rebuild(command)
+    finally:
+        # Im selben Event Loop schliessen, der die Verbindungen geoeffnet hat
+        await engine.dispose()
+
+
+async def check_or_rebuild(command: str) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(upgrade_schema)
+    async with AsyncSessionLocal() as session:
+        if command == "rebuild":
+            await logic.rebuild_stats(session)
+            print("Statistik neu berechnet.")
+            return 0
+        problems = await logic.verify_stats(session)
+    for problem in problems:
+        print(problem)
+    if problems:
+        print(f"{len(problems)} Abweichung(en) gefunden.")
+        return 1
+    print("Statistik ist konsistent.")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Aggregat-Statistik pruefen oder komplett neu berechnen."
+    )
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    args = parser.parse_args()
+    exit_code = asyncio.run(run(args.command))
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
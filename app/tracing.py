@@ -0,0 +1,169 @@
+import logging
+import os
+import random
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from typing import Any, Optional, TypeVar
+
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 0 = aus, 1 = jede Anfrage, dazwischen Stichprobe (z.B. 0.01 in Produktion)
+SQL_TRACE_SAMPLE_RATE = float(os.getenv("SQL_TRACE_SAMPLE_RATE", "0"))
+# In Tests auf 1 setzen: ueberschrittene Query-Budgets werfen dann eine Exception
+SQL_QUERY_BUDGET_ENFORCE = os.getenv("SQL_QUERY_BUDGET_ENFORCE", "0") == "1"
+
+logger = logging.getLogger("app.sql")
+
+QUERY_BUDGETS: dict[str, int] = {}
+
+EndpointT = TypeVar("EndpointT", bound=Callable[..., Any])
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestTrace:
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        # Zeilenzahl None, wo der Treiber kein rowcount kennt (SELECTs)
+        self.queries: list[tuple[str, float, Optional[int]]] = []
+        self.render_seconds = 0.0
+
+    @property
+    def db_seconds(self) -> float:
+        return sum(duration for _, duration, _ in self.queries)
+
+    def server_timing(self) -> str:
+        total_ms = (time.perf_counter() - self.started_at) * 1000
+        return (
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{len(self.queries)} queries", '
+            f"render;dur={self.render_seconds * 1000:.1f}, "
+            f"total;dur={total_ms:.1f}"
+        )
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def query_budget(max_queries: int) -> Callable[[EndpointT], EndpointT]:
+    # Unter @app.get/@app.post setzen, Schluessel ist der Funktionsname der Route
+    def decorator(endpoint: EndpointT) -> EndpointT:
+        QUERY_BUDGETS[endpoint.__name__] = max_queries
+        return endpoint
+
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Startzeit am Execution Context (einer pro Statement) statt an der
+    # Connection, dann bleibt bei fehlschlagenden Statements nichts liegen
+    if _current_trace.get() is not None and context is not None:
+        context._query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    started_at = getattr(context, "_query_started_at", None)
+    if trace is None or started_at is None:
+        return
+    duration = time.perf_counter() - started_at
+    # DBAPI rowcount gilt nur fuer INSERT/UPDATE/DELETE, bei SELECTs ist er -1
+    row_count = cursor.rowcount if cursor.rowcount >= 0 else None
+    trace.queries.append((statement, duration, row_count))
+
+
+def install_sql_tracing(engine: AsyncEngine) -> None:
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class TracedTemplate(Template):
+    def render(self, *args: Any, **kwargs: Any) -> str:
+        trace = _current_trace.get()
+        if trace is None:
+            return super().render(*args, **kwargs)
+        started_at = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            trace.render_seconds += time.perf_counter() - started_at
+
+
+class SQLTracingMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rate: float = SQL_TRACE_SAMPLE_RATE,
+        enforce_budgets: bool = SQL_QUERY_BUDGET_ENFORCE,
+    ) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+        self.enforce_budgets = enforce_budgets
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not self.enforce_budgets and random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+
+        async def traced_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                self.check_budget(scope, trace)
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            _current_trace.reset(token)
+        self.log_trace(scope, trace)
+
+    def check_budget(self, scope: Scope, trace: RequestTrace) -> None:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return
+        budget = QUERY_BUDGETS.get(endpoint.__name__)
+        if budget is None or len(trace.queries) <= budget:
+            return
+        message = (
+            f"{scope['method']} {scope['path']} ({endpoint.__name__}) hat "
+            f"{len(trace.queries)} Queries ausgefuehrt, Budget ist {budget}"
+        )
+        if self.enforce_budgets:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    def log_trace(self, scope: Scope, trace: RequestTrace) -> None:
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        logger.debug(
+            "%s %s: %d Queries, %s",
+            scope["method"],
+            scope["path"],
+            len(trace.queries),
+            trace.server_timing(),
+        )
+        for statement, duration, row_count in trace.queries:
+            logger.debug(
+                "  %.1f ms, %s Zeilen: %s",
+                duration * 1000,
+                "?" if row_count is None else row_count,
+                " ".join(statement.split()),
+            )
@@ -0,0 +1,61 @@
+import asyncio
+import io
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Die app-Module lesen ihre ENV beim Import, daher vor dem ersten Import setzen
+TEST_DIR = Path(tempfile.mkdtemp(prefix="app-tests-"))
+os.environ["DATABASE_URL"] = f"sqlite:///{TEST_DIR / 'test.db'}"
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ["PARTIAL_UPLOAD_DIR"] = str(TEST_DIR / "partial_uploads")
+os.environ["SQL_QUERY_BUDGET_ENFORCE"] = "1"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from app import main  # noqa: E402
+from app.db import engine  # noqa: E402
+from app.models import Base, upgrade_schema  # noqa: E402
+
+
+async def reset_database() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(upgrade_schema)
+    # Jeder Test laeuft in eigenem Event Loop, keine Verbindungen mitnehmen
+    await engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def database():
+    asyncio.run(reset_database())
+
+
+def png_bytes(size: tuple[int, int] = (40, 30)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "orange").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+    # Uploads landen im tmp-Verzeichnis statt in app/static/uploads
+    monkeypatch.setattr(main, "BASE_DIR", tmp_path)
+    monkeypatch.setattr(main, "TEMPLATE_DIR", tmp_path / "static/uploads/templates")
+    monkeypatch.setattr(main, "MEME_DIR", tmp_path / "static/uploads/memes")
+    return tmp_path / "static"
+
+
+@pytest.fixture
+def client(static_dir):
+    with TestClient(main.app) as test_client:
+        response = test_client.post(
+            "/login",
+            data={"name": "Testerin", "password": main.APP_PASSWORD},
+            follow_redirects=False,
+        )
+        assert response.status_code == 303
+        yield test_client
@@ -0,0 +1,144 @@
+from collections import Counter
+
+import pytest
+
+from app.limits import AdmissionControl, TokenBucket, admission
+
+from .conftest import png_bytes
+
+USER_KEY = "user:Testerin"
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    # Niedrige Grenzen am globalen Controller, den die Middleware nutzt
+    for name, value in {
+        "upload_concurrency": 2,
+        "upload_concurrency_per_user": 1,
+        "react_rate": 0.5,
+        "react_burst": 2,
+        "max_upload_bytes": 4096,
+        "active_uploads": 0,
+        "active_uploads_by_user": Counter(),
+        "react_buckets": {},
+        "shed": Counter(),
+    }.items():
+        monkeypatch.setattr(admission, name, value)
+    return admission
+
+
+def upload(client, content: bytes, **kwargs):
+    return client.post(
+        "/memes/upload",
+        data={"title": "Gross"},
+        files={"file": ("bild.png", content, "image/png")},
+        follow_redirects=False,
+        **kwargs,
+    )
+
+
+def test_token_bucket_refills_and_reports_retry_after():
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+    assert bucket.retry_after() == 1
+    # Eine Sekunde spaeter sind zwei Token nachgelaufen
+    bucket.updated_at -= 1
+    assert [bucket.try_take() for _ in range(3)] == [True, True, False]
+    assert TokenBucket(rate=0, burst=1).retry_after() == 60
+
+
+def test_upload_slots_per_user_and_global():
+    control = AdmissionControl(upload_concurrency=2, upload_concurrency_per_user=1)
+    assert control.try_acquire_upload("user:a") is None
+    assert control.try_acquire_upload("user:a") == "upload_user"
+    assert control.try_acquire_upload("user:b") is None
+    assert control.try_acquire_upload("user:c") == "upload_global"
+    control.release_upload("user:a")
+    control.release_upload("user:b")
+    assert control.active_uploads == 0
+    assert not control.active_uploads_by_user
+
+
+def test_sweep_drops_only_refilled_buckets():
+    control = AdmissionControl(react_rate=1, react_burst=2)
+    idle = control.react_bucket("ip:idle")
+    idle.try_take()
+    idle.updated_at -= 10
+    busy = control.react_bucket("ip:busy")
+    busy.try_take()
+    busy.try_take()
+    control.react_swept_at -= 10
+    control.react_bucket("ip:new")
+    assert set(control.react_buckets) == {"ip:busy", "ip:new"}
+
+
+def test_rejects_declared_oversized_upload(limits, client):
+    response = upload(client, png_bytes((400, 400)) + b"\0" * 8192)
+    assert response.status_code == 413
+    assert limits.shed["body_too_large"] == 1
+    assert limits.active_uploads == 0
+
+
+def test_rejects_streamed_oversized_upload(limits, client):
+    # Ohne Content-Length (chunked) greift erst das Zaehlen der Bytes; der 400
+    # von FastAPI wird dabei verworfen und durch 413 ersetzt
+    boundary = "grenze"
+    head = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="title"\r\n\r\nGross\r\n'
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="bild.png"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode()
+
+    def body():
+        yield head
+        for _ in range(8):
+            yield b"\0" * 1024
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = client.post(
+        "/memes/upload",
+        content=body(),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        follow_redirects=False,
+    )
+    assert "content-length" not in response.request.headers
+    assert response.status_code == 413
+    assert response.text == "Die Datei ist zu gross."
+    assert limits.shed["body_too_large"] == 1
+    assert limits.active_uploads == 0
+
+
+def test_sheds_uploads_per_user_and_globally(limits, client):
+    assert limits.try_acquire_upload(USER_KEY) is None
+    response = upload(client, png_bytes())
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "5"
+
+    assert limits.try_acquire_upload("user:andere") is None
+    limits.upload_concurrency_per_user = 2
+    response = upload(client, png_bytes())
+    assert response.status_code == 503
+    assert limits.shed == Counter({"upload_user": 1, "upload_global": 1})
+
+    limits.release_upload(USER_KEY)
+    limits.release_upload("user:andere")
+    assert upload(client, png_bytes()).status_code == 303
+    assert limits.active_uploads == 0
+
+
+def test_rate_limits_reactions(limits, client):
+    assert upload(client, png_bytes()).status_code == 303
+    meme_id = 1  # frische Datenbank pro Test
+    statuses = [
+        client.post(
+            f"/memes/{meme_id}/react",
+            data={"reaction": "like"},
+            headers={"Accept": "application/json"},
+        )
+        for _ in range(3)
+    ]
+    assert [response.status_code for response in statuses] == [200, 200, 429]
+    assert statuses[-1].headers["retry-after"] == "2"
+    assert limits.shed["react_rate"] == 1
@@ -0,0 +1,126 @@
+import asyncio
+import base64
+import re
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import main
+from app.db import engine
+from app.tracing import (
+    QUERY_BUDGETS,
+    QueryBudgetExceeded,
+    RequestTrace,
+    _current_trace,
+)
+
+from .conftest import png_bytes
+
+
+def upload(client, path: str, title: str) -> int:
+    response = client.post(
+        path,
+        data={"title": title},
+        files={"file": ("bild.png", png_bytes(), "image/png")},
+        follow_redirects=False,
+    )
+    assert response.status_code == 303
+    listing = client.get(response.headers["location"])
+    return int(re.findall(r'href="/(?:memes|templates)/(\d+)"', listing.text)[0])
+
+
+def tus_metadata(**values: str) -> str:
+    return ",".join(
+        f"{key} {base64.b64encode(value.encode()).decode()}"
+        for key, value in values.items()
+    )
+
+
+def test_routes_stay_within_query_budgets(client):
+    # SQL_QUERY_BUDGET_ENFORCE=1 (conftest): jede Ueberschreitung wirft
+    template_id = upload(client, "/templates/upload", "Vorlage")
+    meme_id = upload(client, "/memes/upload", "Meme")
+
+    for path in (
+        "/",
+        "/stats",
+        "/templates",
+        f"/templates/{template_id}",
+        "/memes",
+        f"/memes/{meme_id}",
+        "/slideshow",
+    ):
+        assert client.get(path).status_code == 200, path
+
+    for reaction in ("like", "dislike"):
+        response = client.post(
+            f"/memes/{meme_id}/react",
+            data={"reaction": reaction},
+            headers={"Accept": "application/json"},
+        )
+        assert response.json()["user_reaction"] == reaction
+
+    for path in (f"/memes/{meme_id}/delete", f"/templates/{template_id}/delete"):
+        response = client.post(
+            path,
+            data={"master_password": main.APP_MASTER_PASSWORD},
+            follow_redirects=False,
+        )
+        assert response.status_code == 303, path
+
+
+def test_resumable_routes_stay_within_query_budgets(client):
+    data = png_bytes()
+    tus = {"Tus-Resumable": "1.0.0"}
+    response = client.post(
+        "/uploads",
+        headers={
+            **tus,
+            "Upload-Length": str(len(data)),
+            "Upload-Metadata": tus_metadata(kind="meme", title="Tus", filename="a.png"),
+        },
+    )
+    assert response.status_code == 201
+    url = response.headers["location"]
+
+    chunk_headers = {**tus, "Content-Type": "application/offset+octet-stream"}
+    response = client.patch(
+        url, headers={**chunk_headers, "Upload-Offset": "0"}, content=data[:10]
+    )
+    assert response.headers["upload-offset"] == "10"
+    response = client.patch(
+        url, headers={**chunk_headers, "Upload-Offset": "10"}, content=data[10:]
+    )
+    assert response.headers["upload-result"] == "/memes"
+
+    response = client.head(url)
+    assert response.headers["upload-offset"] == str(len(data))
+    assert response.headers["upload-result"] == "/memes"
+    assert client.delete(url, headers=tus).status_code == 204
+
+
+def test_budget_overrun_raises(client, monkeypatch):
+    monkeypatch.setitem(QUERY_BUDGETS, "memes_list", 0)
+    with pytest.raises(QueryBudgetExceeded, match="memes_list"):
+        client.get("/memes")
+
+
+def test_trace_records_row_counts_and_skips_failed_statements():
+    async def scenario():
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                with pytest.raises(OperationalError):
+                    await conn.execute(text("SELECT * FROM gibt_es_nicht"))
+                await conn.execute(text("UPDATE memes SET title = title"))
+        finally:
+            _current_trace.reset(token)
+            await engine.dispose()
+        return trace
+
+    trace = asyncio.run(scenario())
+    assert [row_count for _, _, row_count in trace.queries] == [None, 0]
+    assert all(duration >= 0 for _, duration, _ in trace.queries)
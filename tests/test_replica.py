@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import db, main
+from app.db import PRIMARY_COOKIE
+
+from .conftest import png_bytes
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    # Zweite, leere SQLite-Datei als "veraltetes" Replica
+    url = f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"
+    replica_engine = create_async_engine(url)
+    session_factory = async_sessionmaker(
+        replica_engine, autocommit=False, autoflush=False, expire_on_commit=False
+    )
+    for module in (db, main):
+        monkeypatch.setattr(module, "replica_engine", replica_engine)
+        monkeypatch.setattr(module, "ReplicaSessionLocal", session_factory)
+    yield replica_engine
+    asyncio.run(replica_engine.dispose())
+
+
+def test_reads_go_to_replica_until_a_write(replica, client):
+    # Auch das Login ist ein Schreibzugriff, erst ohne Cookie starten
+    assert PRIMARY_COOKIE in client.cookies
+    client.cookies.delete(PRIMARY_COOKIE)
+
+    response = client.post(
+        "/memes/upload",
+        data={"title": "Frisch hochgeladen"},
+        files={"file": ("bild.png", png_bytes(), "image/png")},
+        follow_redirects=False,
+    )
+    assert response.status_code == 303
+    assert PRIMARY_COOKIE in client.cookies
+    # Mit Cookie vom Primary: der eigene Upload ist sofort sichtbar
+    assert "Frisch hochgeladen" in client.get("/memes").text
+
+    client.cookies.delete(PRIMARY_COOKIE)
+    # Ohne Cookie vom Replica, das den Upload (noch) nicht kennt
+    for path in ("/", "/memes", "/templates", "/stats"):
+        assert client.get(path).status_code == 200, path
+    assert "Frisch hochgeladen" not in client.get("/memes").text
@@ -0,0 +1,164 @@
+import asyncio
+import base64
+import hashlib
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from app import logic, resumable
+
+from .conftest import png_bytes
+
+
+def b64(value: str) -> str:
+    return base64.b64encode(value.encode()).decode()
+
+
+async def chunks(*parts: bytes, disconnect: bool = False):
+    for part in parts:
+        yield part
+    if disconnect:
+        raise ClientDisconnect()
+
+
+def append(upload_id: str, offset: int, *parts: bytes, checksum=None, **kwargs) -> int:
+    info = resumable.load_upload(upload_id, "bob")
+    return asyncio.run(
+        resumable.append_chunk(
+            upload_id, info, offset, chunks(*parts, **kwargs), checksum
+        )
+    )
+
+
+def offset_of(upload_id: str) -> int:
+    return resumable.load_upload(upload_id, "bob")["offset"]
+
+
+@pytest.fixture
+def upload_id():
+    return resumable.create_upload("bob", 10, {"kind": "meme"})
+
+
+def test_parse_metadata():
+    header = f"kind {b64('meme')}, title {b64('Grüße')},empty "
+    assert resumable.parse_metadata(header) == {
+        "kind": "meme",
+        "title": "Grüße",
+        "empty": "",
+    }
+    assert resumable.parse_metadata("") == {}
+    with pytest.raises(resumable.UploadError) as error:
+        resumable.parse_metadata("title nicht-base64!")
+    assert error.value.status_code == 400
+
+
+def test_load_upload_checks_owner(upload_id):
+    assert resumable.load_upload(upload_id, "eve") is None
+    assert resumable.load_upload("../etc/passwd", "bob") is None
+
+
+def test_append_chunk_rejects_wrong_offset(upload_id):
+    assert append(upload_id, 0, b"abc") == 3
+    with pytest.raises(resumable.UploadError) as error:
+        append(upload_id, 0, b"abc")
+    assert error.value.status_code == 409
+    assert offset_of(upload_id) == 3
+
+
+def test_append_chunk_rejects_data_past_length(upload_id):
+    with pytest.raises(resumable.UploadError) as error:
+        append(upload_id, 0, b"0123456789", b"x")
+    assert error.value.status_code == 400
+    # Ohne Checksumme bleibt der gueltige Teil erhalten
+    assert offset_of(upload_id) == 10
+
+
+def test_append_chunk_verifies_checksum(upload_id):
+    checksum = hashlib.sha256(b"abcdef").digest()
+    assert append(upload_id, 0, b"abc", b"def", checksum=checksum) == 6
+    with pytest.raises(resumable.UploadError) as error:
+        append(upload_id, 6, b"ghi", checksum=checksum)
+    assert error.value.status_code == 460
+    # Falsche Checksumme: der Chunk wird wieder abgeschnitten
+    assert offset_of(upload_id) == 6
+
+
+def test_append_chunk_keeps_bytes_on_disconnect(upload_id):
+    assert append(upload_id, 0, b"abc", disconnect=True) == 3
+    assert offset_of(upload_id) == 3
+    assert append(upload_id, 3, b"def") == 6
+
+
+def test_append_chunk_drops_unverified_bytes_on_disconnect(upload_id):
+    checksum = hashlib.sha256(b"abcdef").digest()
+    assert append(upload_id, 0, b"abc", checksum=checksum, disconnect=True) == 0
+    assert offset_of(upload_id) == 0
+    assert append(upload_id, 0, b"abc", b"def", checksum=checksum) == 6
+
+
+def test_completed_upload_reports_result(upload_id, tmp_path):
+    append(upload_id, 0, b"0123456789")
+    info = resumable.load_upload(upload_id, "bob")
+    resumable.finish_upload(upload_id, tmp_path / "bild.png")
+    resumable.complete_upload(upload_id, info, "/memes")
+    info = resumable.load_upload(upload_id, "bob")
+    assert info["offset"] == info["length"] == 10
+    assert info["result"] == "/memes"
+    assert (tmp_path / "bild.png").read_bytes() == b"0123456789"
+
+
+def test_head_waits_while_upload_is_finalizing(upload_id, tmp_path):
+    append(upload_id, 0, b"0123456789")
+    info = resumable.load_upload(upload_id, "bob")
+
+    async def scenario():
+        async with resumable.upload_lock(upload_id):
+            resumable.finish_upload(upload_id, tmp_path / "bild.png")
+            waiter = asyncio.create_task(resumable.wait_for_finish(upload_id))
+            await asyncio.sleep(0)
+            assert not waiter.done()
+            resumable.complete_upload(upload_id, info, "/memes")
+        await waiter
+
+    asyncio.run(scenario())
+    assert resumable.load_upload(upload_id, "bob")["result"] == "/memes"
+
+
+def test_failed_finalization_restores_upload(client, static_dir, monkeypatch):
+    data = png_bytes()
+    response = client.post(
+        "/uploads",
+        headers={
+            "Tus-Resumable": "1.0.0",
+            "Upload-Length": str(len(data)),
+            "Upload-Metadata": (
+                f"kind {b64('meme')},title {b64('T')},filename {b64('a.png')}"
+            ),
+        },
+    )
+    url = response.headers["location"]
+    headers = {
+        "Tus-Resumable": "1.0.0",
+        "Content-Type": "application/offset+octet-stream",
+    }
+
+    async def broken_create(*args, **kwargs):
+        raise RuntimeError("Datenbank weg")
+
+    create_meme = logic.create_meme
+    monkeypatch.setattr(logic, "create_meme", broken_create)
+    with pytest.raises(RuntimeError):
+        client.patch(url, headers={**headers, "Upload-Offset": "0"}, content=data)
+    # Nichts bleibt in static/uploads liegen, die Daten sind wieder im Upload
+    assert list((static_dir / "uploads/memes").iterdir()) == []
+    response = client.head(url)
+    assert response.headers["upload-offset"] == str(len(data))
+    assert "upload-result" not in response.headers
+
+    # Leerer Chunk am Ende loest den Abschluss erneut aus
+    monkeypatch.setattr(logic, "create_meme", create_meme)
+    response = client.patch(
+        url, headers={**headers, "Upload-Offset": str(len(data))}, content=b""
+    )
+    assert response.status_code == 204
+    assert response.headers["upload-result"] == "/memes"
@@ -0,0 +1,87 @@
+import asyncio
+
+from sqlalchemy import select
+
+from app import logic
+from app.db import AsyncSessionLocal, engine
+from app.models import MemeReaction
+
+
+def run(scenario):
+    async def wrapper():
+        try:
+            await scenario()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(wrapper())
+
+
+async def assert_stats(expected: dict[str, int]) -> None:
+    async with AsyncSessionLocal() as session:
+        assert await logic.verify_stats(session) == []
+        assert await logic.get_meme_stats(session) == expected
+
+
+def test_stats_follow_create_react_delete():
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            meme = await logic.create_meme(session, "Meme", "m.png", None, "bob")
+            other = await logic.create_meme(session, "Zwei", "z.png", None, "bob")
+            template = await logic.create_template(session, "T", "t.png", None, "eve")
+            await logic.set_reaction(session, meme.id, "eve", "like")
+            await logic.set_reaction(session, meme.id, "zoe", "like")
+            await logic.set_reaction(session, other.id, "eve", "like")
+            await logic.set_reaction(session, meme.id, "zoe", "dislike")
+        await assert_stats({"templates": 1, "memes": 2, "likes": 2, "dislikes": 1})
+
+        async with AsyncSessionLocal() as session:
+            await logic.delete_meme(session, meme.id)
+            await logic.delete_template(session, template.id)
+        await assert_stats({"templates": 0, "memes": 1, "likes": 1, "dislikes": 0})
+
+    run(scenario)
+
+
+def test_stats_survive_double_delete():
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            meme = await logic.create_meme(session, "Meme", "m.png", None, "bob")
+            template = await logic.create_template(session, "T", "t.png", None, "bob")
+            await logic.set_reaction(session, meme.id, "eve", "like")
+
+        # Zwei Requests haben das Meme geladen, bevor einer loescht (die Route
+        # haelt es als item, die Identity Map kennt es also noch)
+        async with AsyncSessionLocal() as first, AsyncSessionLocal() as second:
+            loaded = [  # noqa: F841
+                await logic.get_meme(first, meme.id),
+                await logic.get_meme(second, meme.id),
+                await logic.get_template(first, template.id),
+                await logic.get_template(second, template.id),
+            ]
+            await logic.delete_meme(first, meme.id)
+            await logic.delete_meme(second, meme.id)
+            await logic.delete_template(first, template.id)
+            await logic.delete_template(second, template.id)
+        await assert_stats({"templates": 0, "memes": 0, "likes": 0, "dislikes": 0})
+
+    run(scenario)
+
+
+def test_stats_survive_concurrent_reaction_switch():
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            meme = await logic.create_meme(session, "Meme", "m.png", None, "bob")
+            await logic.set_reaction(session, meme.id, "eve", "like")
+
+        # Beide Sessions sehen noch "like" und wechseln auf "dislike"
+        async with AsyncSessionLocal() as first, AsyncSessionLocal() as second:
+            loaded = [  # noqa: F841
+                await first.scalar(select(MemeReaction)),
+                await second.scalar(select(MemeReaction)),
+            ]
+            assert await logic.set_reaction(first, meme.id, "eve", "dislike")
+            assert await logic.set_reaction(second, meme.id, "eve", "dislike")
+        await assert_stats({"templates": 0, "memes": 1, "likes": 0, "dislikes": 1})
+
+    run(scenario)